@@ -1,30 +1,100 @@
+import asyncio
+import os
+import sys
+import time
 import uuid
-from typing import Dict, Optional
-import threading
+from collections import OrderedDict
+from functools import lru_cache, partial
+from itertools import chain
+from pathlib import Path
+from typing import Optional
 
 import schemas
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel
+from services import task_queue
 from services.github_service import GitHubService
 from services.report_generator import generate_github_report
 from utils.file_utils import get_report_file_path
+from utils.task_state import (
+    _normalize_filters,
+    _purge_expired_tasks,
+    report_tasks,
+    report_tasks_lock,
+)
+
+# Кэш горячих отчетов в памяти: повторные скачивания не трогают диск.
+# Файлы отчетов неизменяемы, поэтому достаточно вытеснения по LRU
+REPORT_CACHE_MAX_BYTES = 128 * 1024 * 1024
+_report_cache: OrderedDict = OrderedDict()
+_report_cache_bytes = 0
+
 
-# Dictionary to store the status of background tasks
-# Ключ - task_id, значение - информация о задаче
-report_tasks: Dict[str, Dict] = {}
-# Блокировка для безопасного доступа к словарю report_tasks
-report_tasks_lock = threading.Lock()
+@lru_cache(maxsize=1)
+def get_github_service() -> GitHubService:
+    """Один общий экземпляр GitHubService вместо создания на каждый запрос.
+
+    Токен авторизации живёт в ContextVar внутри сервиса, поэтому экземпляр
+    безопасно делить между одновременными запросами.
+    """
+    return GitHubService()
 
 
 # Email request model
 class EmailRequest(BaseModel):
     email: str | None
+    # Приоритет очереди отчетов: high / normal / low
+    priority: str | None = None
 
 
 router = APIRouter()
 
 
+def _assemble_commits(merged_prs: dict, pr_commits: dict, commit_details: dict):
+    """Обогащает PR данными о коммитах и файлах (CPU-bound, вне event loop).
+
+    Списки коммитов и файлов строятся comprehension-ами: список сразу
+    нужного размера без повторных реаллокаций и поиска .append. File —
+    TypedDict, поэтому файлы остаются обычными словарями; конструктор
+    Commit валидирует их и приводит дату автора из ISO-строки. sys.intern
+    схлопывает повторяющиеся имена файлов и данные автора в один объект.
+    """
+    commit_details_get = commit_details.get
+    intern = sys.intern
+    make_commit = schemas.Commit
+
+    for item in merged_prs["items"]:
+        item["commits"] = [
+            make_commit(
+                sha=commit_info["sha"],
+                url=commit_info["url"],
+                author={
+                    "name": intern(commit_info["commit"]["author"]["name"]),
+                    "email": intern(commit_info["commit"]["author"]["email"]),
+                    "date": commit_info["commit"]["author"]["date"],
+                },
+                message=commit_info["commit"]["message"],
+                files=[
+                    {
+                        "filename": intern(file["filename"]),
+                        "additions": file["additions"],
+                        "deletions": file["deletions"],
+                        "changes": file["changes"],
+                        "status": file["status"],
+                        "patch": file.get("patch", ""),
+                        # Не убирать!
+                        # "raw": raw_files[pr_index][commit_index][file_index],
+                        "raw": file["raw_url"],
+                    }
+                    for file in commit_details_get(commit_info["url"], {}).get(
+                        "files", ()
+                    )
+                ],
+            )
+            for commit_info in pr_commits.get(item["number"], [])
+        ]
+
+
 @router.get(
     "/github/repo/{owner}/{repo}/mergedcount",
     summary="Получить список контрибьютеров с количеством мерджей в репозитории",
@@ -35,7 +105,7 @@ async def get_github_repo_merged_count(
     owner: str,
     repo: str,
     date_filter: Optional[str] = Query(""),
-    github_service: GitHubService = Depends(GitHubService),
+    github_service: GitHubService = Depends(get_github_service),
 ):
     github_service.set_authorization_header(request)
 
@@ -61,13 +131,12 @@ async def get_github_repo_async(
     owner: str,
     repo: str,
     email_data: EmailRequest,
-    background_tasks: BackgroundTasks,
     contributors: Optional[str] = Query(
         ""
     ),  # Now expects comma-separated list of logins
     contributor_email_filter: Optional[str] = Query(""),
     date_filter: Optional[str] = Query(""),
-    github_service: GitHubService = Depends(GitHubService),
+    github_service: GitHubService = Depends(get_github_service),
 ):
     github_service.set_authorization_header(request)
 
@@ -82,38 +151,52 @@ async def get_github_repo_async(
         ]
 
     # Store initial task info with thread-safe access
-    with report_tasks_lock:
+    async with report_tasks_lock:
+        _purge_expired_tasks()
         report_tasks[task_id] = {
             "status": "processing",
+            "created_at": time.monotonic(),
             "owner": owner,
             "repo": repo,
             "email": email_data.email if email_data.email else "",
             "contributors": contributor_logins,
             "date_filter": date_filter,
-            "pending_contributors": contributor_logins.copy()
-            if contributor_logins
-            else [],
-            "completed_contributors": [],
+            # Множества дают O(1) проверку и удаление при завершении
+            # каждого контрибьютора
+            "pending_contributors": set(contributor_logins),
+            "completed_contributors": set(),
             "results": {},
         }
 
-    # Process each contributor in the background
+    # Ставим каждого контрибьютора в очередь отчетов: интерактивные задачи
+    # (priority=high) обрабатываются раньше массовых
+    queue_position = 0
     if contributor_logins:
         for contributor_login in contributor_logins:
-            background_tasks.add_task(
-                generate_github_report,
-                task_id,
-                owner,
-                repo,
-                contributor_login,
-                contributor_email_filter,
-                date_filter,
-                email_data.email if email_data.email else "",
-                github_service,
-                report_tasks,
+            queue_position = await task_queue.enqueue(
+                partial(
+                    generate_github_report,
+                    task_id,
+                    owner,
+                    repo,
+                    contributor_login,
+                    contributor_email_filter,
+                    date_filter,
+                    email_data.email if email_data.email else "",
+                    github_service,
+                    report_tasks,
+                ),
+                priority=email_data.priority or task_queue.DEFAULT_PRIORITY,
             )
 
-    return {"task_id": task_id, "status": "processing"}
+        async with report_tasks_lock:
+            report_tasks[task_id]["queue_position"] = queue_position
+
+    return {
+        "task_id": task_id,
+        "status": "processing",
+        "queue_position": queue_position,
+    }
 
 
 @router.get(
@@ -129,7 +212,8 @@ async def get_github_repo_async(
 async def get_task_status(task_id: str):
     """Get the status of a background task"""
     # Безопасный доступ к словарю report_tasks
-    with report_tasks_lock:
+    async with report_tasks_lock:
+        _purge_expired_tasks()
         if task_id not in report_tasks:
             raise HTTPException(status_code=404, detail="Task not found")
 
@@ -142,12 +226,13 @@ async def get_task_status(task_id: str):
     }
 
     # Include information about pending, completed, and failed contributors
+    # (множества сериализуем отсортированными списками)
     if "pending_contributors" in task_info:
-        response["pending_contributors"] = task_info["pending_contributors"]
+        response["pending_contributors"] = sorted(task_info["pending_contributors"])
     if "completed_contributors" in task_info:
-        response["completed_contributors"] = task_info["completed_contributors"]
+        response["completed_contributors"] = sorted(task_info["completed_contributors"])
     if "failed_contributors" in task_info:
-        response["failed_contributors"] = task_info["failed_contributors"]
+        response["failed_contributors"] = sorted(task_info["failed_contributors"])
 
     # Include the contributor currently being processed
     if "processing_contributor" in task_info:
@@ -175,28 +260,22 @@ async def get_github_repo_contributors(
     repo: str,
     contributor_login_filter: Optional[str] = Query(""),
     contributor_email_filter: Optional[str] = Query(""),
-    github_service: GitHubService = Depends(GitHubService),
+    github_service: GitHubService = Depends(get_github_service),
 ):
     github_service.set_authorization_header(request)
 
     contributors = await github_service.get_repo_contributors(owner, repo)
 
-    try:
-        if contributor_login_filter:
-            return [
-                contributor
-                for contributor in contributors
-                if str(contributor["login"]).lower() == contributor_login_filter.lower()
-            ][0]
-
-        if contributor_email_filter:
-            return [
-                contributor
-                for contributor in contributors
-                if str(contributor["email"]).lower() == contributor_email_filter.lower()
-            ][0]
-    except Exception:
-        return {}
+    # Индексы логин/почта -> контрибьютор для O(1) поиска вместо линейного скана
+    if contributor_login_filter:
+        by_login = {str(c["login"]).lower(): c for c in contributors}
+        return by_login.get(contributor_login_filter.lower(), {})
+
+    if contributor_email_filter:
+        by_email = {
+            str(c["email"]).lower(): c for c in contributors if c.get("email")
+        }
+        return by_email.get(contributor_email_filter.lower(), {})
 
     return contributors
 
@@ -215,37 +294,38 @@ async def get_github_repo(
     contributor_login_filter: Optional[str] = Query(""),
     contributor_email_filter: Optional[str] = Query(""),
     date_filter: Optional[str] = Query(""),
-    github_service: GitHubService = Depends(GitHubService),
+    page: int = Query(1, ge=1),
+    per_page: int = Query(30, ge=1, le=100),
+    github_service: GitHubService = Depends(get_github_service),
 ):
     github_service.set_authorization_header(request)
 
-    # Формирование фильтра по датам
-    if date_filter != "":
-        date_filter = f"+created:{date_filter}"
-
-    # Формирование фильтра по датам
-    if contributor_login_filter != "":
-        contributor_login_filter = contributor_login_filter.lower()
-    if contributor_email_filter != "":
-        contributor_email_filter = contributor_email_filter.lower()
+    # Формирование фильтров по контрибьютору и датам
+    contributor_login_filter, contributor_email_filter, date_filter = (
+        _normalize_filters(
+            contributor_login_filter, contributor_email_filter, date_filter
+        )
+    )
 
     contributor_details = await github_service.get_repo_contributors(owner, repo)
 
-    try:
-        if contributor_email_filter and not contributor_login_filter:
-            contributor_login_filter = [
-                str(contributor["login"]).lower()
-                for contributor in contributor_details
-                if str(contributor["email"]).lower() == contributor_email_filter
-            ][0]
-    except Exception:
-        contributor_login_filter = ""
+    # Индексы логин -> контрибьютор и почта -> логин строятся один раз
+    by_login = {
+        str(contributor["login"]).lower(): contributor
+        for contributor in contributor_details
+    }
+    by_email = {
+        str(contributor["email"]).lower(): str(contributor["login"]).lower()
+        for contributor in contributor_details
+        if contributor.get("email")
+    }
+
+    if contributor_email_filter and not contributor_login_filter:
+        contributor_login_filter = by_email.get(contributor_email_filter, "")
 
     # Получение информации о репозитории
     try:
         # Запрашиваем информацию о репозитории и PR параллельно
-        import asyncio
-
         repo_info, merged_prs = await asyncio.gather(
             github_service.get_repo_info(owner, repo),
             github_service.get_merged_prs(
@@ -253,6 +333,11 @@ async def get_github_repo(
             ),
         )
 
+        # Обрабатываем только запрошенную страницу, чтобы ограничить память
+        merged_prs["items"] = merged_prs["items"][
+            (page - 1) * per_page : page * per_page
+        ]
+
         # Получаем номера PR
         pr_numbers = [item["number"] for item in merged_prs["items"]]
 
@@ -261,10 +346,13 @@ async def get_github_repo(
             owner, repo, contributor_login_filter, pr_numbers
         )
 
-        # Собираем все URL коммитов
-        commit_urls = []
-        for commits in pr_commits.values():
-            commit_urls.extend([commit["url"] for commit in commits])
+        # Собираем все URL коммитов одним проходом
+        commit_urls = list(
+            chain.from_iterable(
+                (commit["url"] for commit in commits)
+                for commits in pr_commits.values()
+            )
+        )
 
         # Получаем детали коммитов
         commit_details = {}
@@ -272,11 +360,8 @@ async def get_github_repo(
             commit_details_list = await github_service.get_commits_details(commit_urls)
             commit_details = {detail["url"]: detail for detail in commit_details_list}
 
-        # Преобразовываем список контрибьютеров в словарь логинов
-        contributor_details = {
-            contributor["login"].lower(): contributor
-            for contributor in contributor_details
-        }
+        # Словарь логинов уже построен выше
+        contributor_details = by_login
 
         # Обогащаем данные пользователей
         for item in merged_prs["items"]:
@@ -293,79 +378,40 @@ async def get_github_repo(
         #     merged_prs, pr_commits, commit_details
         # )
 
-        # Обогащаем данные о коммитах
-        for pr_index, item in enumerate(merged_prs["items"]):
-            pr_number = item["number"]
-            commits_for_pr = pr_commits.get(pr_number, [])
-
-            commits = []
-            for commit_index, commit_info in enumerate(commits_for_pr):
-                # Получение детальной информации о коммите
-                commit_detail = commit_details.get(commit_info["url"], {})
-
-                # Обработка файлов в коммите
-                file_list = []
-                for file_index, file in enumerate(commit_detail.get("files", [])):
-                    file_list.append(
-                        schemas.File(
-                            filename=file["filename"],
-                            additions=file["additions"],
-                            deletions=file["deletions"],
-                            changes=file["changes"],
-                            status=file["status"],
-                            patch=file.get("patch", ""),
-                            # Не убирать!
-                            # raw=raw_files[pr_index][commit_index][file_index],
-                            raw=file["raw_url"],
-                        )
-                    )
-
-                # Создание объекта коммита
-                commits.append(
-                    schemas.Commit(
-                        sha=commit_info["sha"],
-                        url=commit_info["url"],
-                        author=schemas.CommitAuthor(**commit_info["commit"]["author"]),
-                        message=commit_info["commit"]["message"],
-                        files=file_list,
-                    )
-                )
-
-            item["commits"] = commits
+        # Обогащаем данные о коммитах в пуле потоков, не блокируя event loop
+        await asyncio.to_thread(
+            _assemble_commits, merged_prs, pr_commits, commit_details
+        )
 
         # Получение топиков репозитория
         topics = repo_info.get("topics", [])
         if not topics and "source" in repo_info:
             topics = repo_info["source"].get("topics", [])
 
-        contributor_id = (
-            contributor_details.get(contributor_login_filter, {}).get("id")
-            if contributor_details.get(contributor_login_filter, {}).get("id")
-            else None
+        # Один поиск контрибьютора вместо цепочек .get(login, {}).get(...)
+        contributor = contributor_details.get(contributor_login_filter) or {}
+        has_contributor_filter = bool(
+            contributor_login_filter or contributor_email_filter
         )
 
-        contributor_name = (
-            contributor_details.get(contributor_login_filter, {}).get("name")
-            if contributor_details.get(contributor_login_filter, {}).get("name")
-            else contributor_details.get(contributor_login_filter, {}).get("login")
-            if contributor_login_filter or contributor_email_filter
-            else None
+        contributor_id = contributor.get("id") or None
+        contributor_name = contributor.get("name") or (
+            contributor.get("login") if has_contributor_filter else None
         )
-
         contributor_email = (
-            contributor_details.get(contributor_login_filter, {}).get("email")
-            if contributor_login_filter or contributor_email_filter
-            else None
+            contributor.get("email") if has_contributor_filter else None
         )
 
-        # Формирование и возврат результата
-        return schemas.GitHubRepo(
-            **merged_prs,
-            language=repo_info.get("language"),
-            topics=topics,
-            contributor_id=contributor_id,
-            contributor_name=contributor_name,
-            contributor_email=contributor_email,
+        # Формирование и возврат результата через предкомпилированный адаптер
+        return schemas.GITHUB_REPO_ADAPTER.validate_python(
+            dict(
+                merged_prs,
+                language=repo_info.get("language"),
+                topics=topics,
+                contributor_id=contributor_id,
+                contributor_name=contributor_name,
+                contributor_email=contributor_email,
+            )
         )
 
     except Exception as e:
@@ -380,15 +426,56 @@ async def get_github_repo(
     tags=["Reports"],
 )
 async def download_report(
+    request: Request,
     owner: str,
     repo: str,
     filename: str,
 ):
-    file_path = get_report_file_path(owner, repo, filename)  # Путь к файлу
-    import os
+    try:
+        file_path = get_report_file_path(owner, repo, filename)  # Путь к файлу
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Файл не найден")
 
-    if os.path.exists(file_path):
-        return FileResponse(
-            path=file_path, filename=filename, media_type="application/octet-stream"
-        )
-    return {"error": "Файл не найден"}
+    try:
+        stat = await asyncio.to_thread(os.stat, file_path)
+    except OSError:
+        # 404 вместо JSON с кодом 200: корректная семантика для клиентов и CDN
+        raise HTTPException(status_code=404, detail="Файл не найден")
+
+    # Отчеты неизменяемы после генерации: mtime+size дают стабильный ETag,
+    # и повторное скачивание сводится к 304 без тела
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    global _report_cache_bytes
+    data = _report_cache.get(file_path)
+    if data is not None:
+        _report_cache.move_to_end(file_path)
+    else:
+        data = await asyncio.to_thread(Path(file_path).read_bytes)
+        if len(data) <= REPORT_CACHE_MAX_BYTES:
+            # Параллельный промах мог уже закэшировать файл, пока мы читали
+            # его с диска: вычитаем перезаписываемую запись, чтобы счетчик
+            # байт не дрейфовал вверх
+            cached = _report_cache.get(file_path)
+            if cached is not None:
+                _report_cache_bytes -= len(cached)
+            _report_cache[file_path] = data
+            _report_cache.move_to_end(file_path)
+            _report_cache_bytes += len(data)
+            while _report_cache_bytes > REPORT_CACHE_MAX_BYTES:
+                _, evicted = _report_cache.popitem(last=False)
+                _report_cache_bytes -= len(evicted)
+
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return Response(
+        content=data,
+        media_type="application/octet-stream",
+        headers=headers,
+    )
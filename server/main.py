@@ -1,3 +1,5 @@
+import asyncio
+import os
 from pathlib import Path
 
 import uvicorn
@@ -5,11 +7,19 @@ from api.routes import router
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
+from services.email_service import close_smtp_client
+from services.task_queue import start_workers, stop_workers
+from utils.log_utils import setup_logging
 
 # Загрузка переменных окружения
 load_dotenv()
 
+# Неблокирующее логирование (QueueHandler + фоновый QueueListener)
+setup_logging()
+
 # Создание директории для отчетов, если она не существует
 REPORTS_DIR = Path("reports")
 REPORTS_DIR.mkdir(exist_ok=True)
@@ -19,6 +29,7 @@ app = FastAPI(
     title="GitHub Code Quality Reporter API",
     description="API для анализа PR и коммитов в GitHub репозиториях",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     openapi_tags=[
         {"name": "GitHub", "description": "Операции с GitHub репозиториями"},
         {"name": "Tasks", "description": "Управление асинхронными задачами"},
@@ -26,15 +37,27 @@ app = FastAPI(
     ],
 )
 
+# Источники фронтенда; в проде задаются через CORS_ORIGINS (через запятую).
+# Конкретный список (вместо "*") позволяет Starlette отдавать преднамеренно
+# вычисленный preflight-ответ и корректен вместе с allow_credentials
+ALLOWED_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
+    if origin.strip()
+]
+
 # CORS конфигурация
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Authorization", "Content-Type"],
 )
 
+# Сжатие больших JSON-ответов (отчеты с патчами легко достигают нескольких МБ)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Подключение статических файлов для отчетов
 app.mount("/reports", StaticFiles(directory="reports"), name="reports")
 
@@ -42,5 +65,34 @@ app.mount("/reports", StaticFiles(directory="reports"), name="reports")
 app.include_router(router, prefix="/api")
 
 
+@app.on_event("startup")
+async def configure_event_loop():
+    """Включает eager task factory (Python 3.12+) для быстрого запуска задач."""
+    if hasattr(asyncio, "eager_task_factory"):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+    start_workers()
+
+
+@app.on_event("shutdown")
+async def shutdown_email_client():
+    """Останавливает воркеров очереди и закрывает общие соединения."""
+    from api.routes import get_github_service
+
+    await stop_workers()
+    await close_smtp_client()
+    await get_github_service().close()
+
+
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="localhost", port=8000, reload=True)
+    # uvloop и httptools заметно быстрее стандартных event loop и HTTP-парсера.
+    # workers остается равным 1: report_tasks и очередь отчетов живут в памяти
+    # процесса и не разделяются между воркерами
+    uvicorn.run(
+        "main:app",
+        host="localhost",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        access_log=False,
+        reload=bool(os.getenv("DEV")),
+    )
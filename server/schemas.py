@@ -1,15 +1,25 @@
 from datetime import datetime
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, TypeAdapter
+from typing_extensions import TypedDict
+
+# Общий конфиг моделей: лишние поля ответов GitHub отбрасываются без
+# аллокации __pydantic_extra__, а frozen убирает защиту присваиваний —
+# модели нигде не мутируются после создания
+_MODEL_CONFIG = ConfigDict(extra="ignore", frozen=True)
 
 
 class PullRequest(BaseModel):
+    model_config = _MODEL_CONFIG
+
     url: str
     merged_at: datetime
 
 
 class User(BaseModel):
+    model_config = _MODEL_CONFIG
+
     id: int
     login: str
     name: str | None
@@ -18,13 +28,16 @@ class User(BaseModel):
     avatar_url: str
 
 
-class CommitAuthor(BaseModel):
+# Листовые структуры горячего пути обогащения: TypedDict вместо BaseModel
+# избавляет от создания модели на каждый файл/коммит и валидируется
+# более дешевой core-схемой
+class CommitAuthor(TypedDict):
     name: str
     email: str
     date: datetime
 
 
-class File(BaseModel):
+class File(TypedDict):
     filename: str
     status: str
     additions: int
@@ -35,6 +48,8 @@ class File(BaseModel):
 
 
 class Commit(BaseModel):
+    model_config = _MODEL_CONFIG
+
     sha: str
     author: CommitAuthor
     message: str
@@ -43,6 +58,8 @@ class Commit(BaseModel):
 
 
 class Item(BaseModel):
+    model_config = _MODEL_CONFIG
+
     id: int
     title: str
     body: str | None
@@ -53,6 +70,8 @@ class Item(BaseModel):
 
 
 class GitHubRepo(BaseModel):
+    model_config = _MODEL_CONFIG
+
     total_count: int
     incomplete_results: bool
     language: str
@@ -61,4 +80,10 @@ class GitHubRepo(BaseModel):
     contributor_name: str | None
     contributor_email: str | None
     items: List[Item]
+    report_file: Optional[str] = ""
     report_filename: Optional[str] = ""
+
+
+# Адаптер компилируется один раз при импорте и валидирует готовый словарь
+# ответа дешевле, чем повторные вызовы конструктора модели
+GITHUB_REPO_ADAPTER = TypeAdapter(GitHubRepo)
@@ -1,8 +1,147 @@
+import asyncio
+import logging
 import os
-import smtplib
+import string
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
+import aiosmtplib
+
+logger = logging.getLogger(__name__)
+
+# Шаблоны письма компилируются один раз при импорте модуля
+_DOWNLOAD_LINK_TEMPLATE = string.Template(
+    """
+            <p><a href="$download_url" style="display: inline-block; background-color: #4CAF50; color: white; padding: 10px 20px;
+               text-align: center; text-decoration: none; border-radius: 4px; font-weight: bold;">Download Report</a></p>
+            """
+)
+
+_HTML_TEMPLATE = string.Template(
+    """
+        <html>
+            <body>
+                <h2>GitHub Code Quality Report</h2>
+                <p>Your report for repository $repo_owner/$repo_name is ready.</p>
+                <p>Report generated for $contributor_name in the date range: $date_range</p>
+                $download_link
+                <p>You can also view the details by returning to the application.</p>
+            </body>
+        </html>
+        """
+)
+
+# Пул постоянных SMTP-соединений: TLS+AUTH handshake амортизируется между
+# отправками, а несколько соединений позволяют слать письма параллельно.
+# Каждое соединение обрабатывает одну команду за раз, поэтому свободные
+# клиенты лежат в очереди и выдаются по одному
+SMTP_POOL_SIZE = 4
+_smtp_pool: asyncio.Queue = asyncio.Queue()
+_pool_size_lock = asyncio.Lock()
+_connections_created = 0
+
+
+async def _connect_smtp(smtp_server, smtp_port, sender_email, password):
+    """Создает и аутентифицирует новое SMTP-соединение."""
+    client = aiosmtplib.SMTP(hostname=smtp_server, port=smtp_port, start_tls=True)
+    await client.connect()
+    logger.debug("Attempting SMTP login...")
+    await client.login(sender_email, password)
+    logger.debug("SMTP login successful")
+    return client
+
+
+async def _acquire_smtp_client(smtp_server, smtp_port, sender_email, password):
+    """Берет свободное соединение из пула или создает новое в пределах лимита."""
+    global _connections_created
+    try:
+        return _smtp_pool.get_nowait()
+    except asyncio.QueueEmpty:
+        pass
+
+    async with _pool_size_lock:
+        if _connections_created < SMTP_POOL_SIZE:
+            _connections_created += 1
+            try:
+                return await _connect_smtp(
+                    smtp_server, smtp_port, sender_email, password
+                )
+            except Exception:
+                _connections_created -= 1
+                raise
+
+    # Пул заполнен — ждем, пока освободится одно из соединений
+    return await _smtp_pool.get()
+
+
+# Количество попыток отправки и базовая задержка экспоненциального backoff
+SMTP_SEND_RETRIES = 3
+SMTP_RETRY_DELAY_SECONDS = 2
+
+
+async def _send_message_once(smtp_server, smtp_port, sender_email, password, message):
+    """Отправляет письмо через пул соединений, переподключаясь при обрыве."""
+    client = await _acquire_smtp_client(
+        smtp_server, smtp_port, sender_email, password
+    )
+    try:
+        try:
+            if not client.is_connected:
+                raise aiosmtplib.SMTPServerDisconnected("stale pooled connection")
+            await client.send_message(message)
+        except aiosmtplib.SMTPServerDisconnected:
+            client = await _connect_smtp(
+                smtp_server, smtp_port, sender_email, password
+            )
+            await client.send_message(message)
+    finally:
+        _smtp_pool.put_nowait(client)
+
+
+async def _send_message(smtp_server, smtp_port, sender_email, password, message):
+    """Отправляет письмо, повторяя попытку с backoff при временных сбоях SMTP.
+
+    Ошибки аутентификации не ретраятся: без нового пароля результат не
+    изменится.
+    """
+    for attempt in range(SMTP_SEND_RETRIES):
+        try:
+            await _send_message_once(
+                smtp_server, smtp_port, sender_email, password, message
+            )
+            return
+        except aiosmtplib.SMTPAuthenticationError:
+            raise
+        except aiosmtplib.SMTPException as e:
+            if attempt == SMTP_SEND_RETRIES - 1:
+                raise
+            delay = SMTP_RETRY_DELAY_SECONDS * 2**attempt
+            logger.warning(
+                "SMTP send failed (attempt %d/%d), retrying in %ds: %s",
+                attempt + 1,
+                SMTP_SEND_RETRIES,
+                delay,
+                str(e),
+            )
+            await asyncio.sleep(delay)
+
+
+async def close_smtp_client():
+    """Закрывает все SMTP-соединения пула (вызывается при остановке приложения)."""
+    global _connections_created
+    async with _pool_size_lock:
+        while True:
+            try:
+                client = _smtp_pool.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if client.is_connected:
+                try:
+                    await client.quit()
+                except Exception:
+                    pass
+        _connections_created = 0
+
 
 async def send_email_report(
     email: str,
@@ -21,13 +160,13 @@ async def send_email_report(
         smtp_port = int(os.getenv("SMTP_PORT"))
 
         if not sender_email or not password:
-            print(
+            logger.warning(
                 "Email credentials not configured. Report was generated but not sent."
             )
             report_tasks[task_id]["status"] = "completed-no-email"
             return
 
-        print(f"Attempting to send email from {sender_email} to {email}")
+        logger.info("Attempting to send email from %s to %s", sender_email, email)
 
         # Create message
         message = MIMEMultipart("alternative")
@@ -42,62 +181,50 @@ async def send_email_report(
         if owner and repo and contributor_login:
             base_url = os.getenv("APP_BASE_URL", "http://localhost:8000")
             download_url = f"{base_url}/api/download-report/{owner}/{repo}/{report_data['filename']}"
-            download_link = f"""
-            <p><a href="{download_url}" style="display: inline-block; background-color: #4CAF50; color: white; padding: 10px 20px; 
-               text-align: center; text-decoration: none; border-radius: 4px; font-weight: bold;">Download Report</a></p>
-            """
+            download_link = _DOWNLOAD_LINK_TEMPLATE.substitute(
+                download_url=download_url
+            )
 
-        html = f"""
-        <html>
-            <body>
-                <h2>GitHub Code Quality Report</h2>
-                <p>Your report for repository {report_data["repo_owner"]}/{report_data["repo_name"]} is ready.</p>
-                <p>Report generated for {report_data["contributor_name"]} in the date range: {report_data.get("date_range", "All time")}</p>
-                {download_link}
-                <p>You can also view the details by returning to the application.</p>
-            </body>
-        </html>
-        """
+        html = _HTML_TEMPLATE.substitute(
+            repo_owner=report_data["repo_owner"],
+            repo_name=report_data["repo_name"],
+            contributor_name=report_data["contributor_name"],
+            date_range=report_data.get("date_range", "All time"),
+            download_link=download_link,
+        )
 
         part = MIMEText(html, "html")
         message.attach(part)
 
         # Send email
         try:
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                server.ehlo()
-                server.starttls()
-                server.ehlo()
-                print("Attempting SMTP login...")
-                server.login(sender_email, password)
-                print("SMTP login successful")
-                server.sendmail(sender_email, email, message.as_string())
-                print(f"Email sent successfully to {email}")
+            await _send_message(
+                smtp_server, smtp_port, sender_email, password, message
+            )
+            logger.info("Email sent successfully to %s", email)
 
             if len(report_tasks[task_id]["pending_contributors"]) == 0:
                 report_tasks[task_id]["status"] = "completed"
                 report_tasks[task_id]["processing_contributor"] = ""
-        except smtplib.SMTPAuthenticationError as auth_error:
+        except aiosmtplib.SMTPAuthenticationError as auth_error:
             error_msg = str(auth_error)
-            print(f"SMTP Authentication Error: {error_msg}")
-            print("\nFor Gmail users:\n")
-            print(
-                "1. Make sure you're using an App Password, not your regular password"
-            )
-            print(
-                "2. Create an App Password at: https://myaccount.google.com/apppasswords"
-            )
-            print("3. Update your .env file with the new App Password")
+            logger.error("SMTP Authentication Error: %s", error_msg)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "For Gmail users: use an App Password instead of the account "
+                    "password (https://myaccount.google.com/apppasswords) and "
+                    "update SMTP_PASSWORD in .env"
+                )
 
             report_tasks[task_id]["status"] = "completed-email-failed"
             report_tasks[task_id]["error"] = (
                 f"Authentication failed. Use an App Password for Gmail: {error_msg}"
             )
         except Exception as e:
-            print(f"Failed to send email: {str(e)}")
+            logger.error("Failed to send email: %s", str(e))
             report_tasks[task_id]["status"] = "completed-email-failed"
             report_tasks[task_id]["error"] = str(e)
     except Exception as e:
-        print(f"Error preparing email: {str(e)}")
+        logger.error("Error preparing email: %s", str(e))
         report_tasks[task_id]["status"] = "completed-email-failed"
         report_tasks[task_id]["error"] = str(e)
@@ -1,57 +1,285 @@
 import asyncio
+import hashlib
+import os
+import time
+from contextvars import ContextVar
 from typing import Any, Dict, List
 
 import aiohttp
+import orjson
 from fastapi import HTTPException, Request
 
+# Кэш ответов GitHub API: ключ -> (время истечения, сериализованные данные).
+# Значения хранятся сериализованными, чтобы попадания возвращали свежие
+# объекты, которые вызывающий код может безопасно мутировать
+_response_cache: Dict[tuple, tuple] = {}
+_CACHE_MISS = object()
+
+# Верхняя граница кэша: старые записи вытесняются в порядке LRU,
+# чтобы кэш не рос безгранично при большом числе репозиториев/токенов
+MAX_CACHE_ENTRIES = 1024
+
+# TTL по типу данных: контрибьютеры меняются редко, поиск PR — чаще
+CONTRIBUTORS_CACHE_TTL = 900
+REPO_INFO_CACHE_TTL = 3600
+MERGED_PRS_CACHE_TTL = 60
+
+
+def _cache_get(key: tuple) -> Any:
+    """Возвращает закэшированное значение или _CACHE_MISS."""
+    entry = _response_cache.get(key)
+    if entry is None:
+        return _CACHE_MISS
+    expires_at, payload = entry
+    if expires_at < time.monotonic():
+        del _response_cache[key]
+        return _CACHE_MISS
+    # Перемещаем ключ в конец: недавно использованные вытесняются последними
+    _response_cache[key] = _response_cache.pop(key)
+    return orjson.loads(payload)
+
+
+def _cache_set(key: tuple, value: Any, ttl: float):
+    """Кладёт значение в кэш, вытесняя самые старые записи сверх лимита."""
+    _response_cache.pop(key, None)
+    _response_cache[key] = (time.monotonic() + ttl, orjson.dumps(value))
+    while len(_response_cache) > MAX_CACHE_ENTRIES:
+        del _response_cache[next(iter(_response_cache))]
+
+
+# Кэш ETag: (url, ...) -> (etag, сериализованный ответ). GitHub на
+# If-None-Match отвечает 304 без тела — это не тратит ни трафик,
+# ни основной rate limit при повторных отчетах по тем же данным
+_etag_cache: Dict[tuple, tuple] = {}
+MAX_ETAG_ENTRIES = 2048
+
+
+# Промахи кэша по одному ключу коалесцируются: параллельные воркеры,
+# запустившие отчеты по одному репозиторию, не дублируют одинаковые запросы
+_inflight_fetches: Dict[tuple, asyncio.Future] = {}
+
+
+async def _get_or_fetch(key: tuple, ttl: float, fetch) -> Any:
+    """Возвращает значение из кэша, при промахе выполняя fetch один раз."""
+    cached = _cache_get(key)
+    if cached is not _CACHE_MISS:
+        return cached
+
+    pending = _inflight_fetches.get(key)
+    if pending is not None:
+        await pending
+        # Лидер уже положил значение в кэш; читаем оттуда, чтобы получить
+        # независимую копию
+        cached = _cache_get(key)
+        if cached is not _CACHE_MISS:
+            return cached
+        return await fetch()
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight_fetches[key] = future
+    try:
+        value = await fetch()
+        _cache_set(key, value, ttl)
+        future.set_result(None)
+        return value
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # помечаем как обработанное
+        raise
+    finally:
+        _inflight_fetches.pop(key, None)
+
+# Расширения исходников, для которых имеет смысл запрашивать raw-содержимое
+SOURCE_EXTENSIONS = {
+    ".py",
+    ".java",
+    ".php",
+    ".js",
+    ".jsx",
+    ".ts",
+    ".tsx",
+    ".go",
+    ".rs",
+    ".rb",
+    ".c",
+    ".cpp",
+    ".h",
+    ".hpp",
+    ".cs",
+    ".kt",
+}
+
+# Файлы с большим числом изменений (lock-файлы, сгенерированный код) не качаем
+MAX_FILE_CHANGES = 5000
+
+# Ограничение одновременных запросов к GitHub: достаточно для параллелизма,
+# но не провоцирует secondary rate limit
+MAX_CONCURRENT_REQUESTS = 20
+_fetch_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+
+def _should_fetch_raw(file: dict) -> bool:
+    """Проверяет, нужно ли запрашивать raw-содержимое файла."""
+    if file.get("status") == "removed":
+        return False
+    if file.get("additions", 0) + file.get("deletions", 0) > MAX_FILE_CHANGES:
+        return False
+    _, ext = os.path.splitext(file.get("filename", ""))
+    return ext.lower() in SOURCE_EXTENSIONS
+
+
+# Заголовок Authorization текущего запроса: хранится в ContextVar, чтобы
+# один общий экземпляр GitHubService можно было безопасно делить между
+# одновременными запросами с разными токенами
+_auth_header: ContextVar[str] = ContextVar("github_auth_header", default="")
+
 
 class GitHubService:
     def __init__(self):
         self.GITHUB_API_URL = "https://api.github.com"
-        self.headers = {
+        self._base_headers = {
             "Accept": "application/vnd.github.v3+json",
             "X-GitHub-Api-Version": "2022-11-28",
         }
+        self._session: aiohttp.ClientSession | None = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Возвращает общую HTTP-сессию, создавая её при первом обращении.
+
+        Одна сессия на сервис переиспользует keep-alive соединения к
+        api.github.com вместо TCP+TLS handshake на каждую пачку запросов.
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=64,
+                    limit_per_host=64,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=75,
+                )
+            )
+        return self._session
+
+    async def close(self):
+        """Закрывает общую HTTP-сессию (вызывается при остановке приложения)."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """Заголовки запроса с токеном авторизации текущего контекста."""
+        return {**self._base_headers, "Authorization": _auth_header.get()}
 
     def set_authorization_header(self, request: Request):
-        """Устанавливает заголовок 'Authorization'."""
+        """Устанавливает заголовок 'Authorization' для текущего запроса."""
         auth_header = request.headers.get("Authorization")
-        self.headers = {
-            **self.headers,
-            "Authorization": auth_header if auth_header else "",
-        }
+        _auth_header.set(auth_header if auth_header else "")
+
+    def _cache_token(self) -> str:
+        """Часть ключа кэша, зависящая от токена авторизации."""
+        auth = _auth_header.get()
+        return hashlib.sha256(auth.encode()).hexdigest()[:16] if auth else ""
 
     async def get_async(self, urls: List[str], text: bool = False) -> List[Any]:
         """Выполняет асинхронные GET запросы к списку URL."""
         if not urls:
             return []
 
-        async with aiohttp.ClientSession() as session:
+        session = self._get_session()
 
-            async def fetch(url: str):
-                if url == "":
+        async def fetch(url: str):
+            headers = self.headers
+            etag_key = (url, text, self._cache_token())
+            cached = _etag_cache.get(etag_key)
+            if cached is not None:
+                headers = {**headers, "If-None-Match": cached[0]}
+
+            async with _fetch_semaphore, session.get(
+                url, headers=headers
+            ) as response:
+                if response.status == 304 and cached is not None:
+                    # Данные не изменились — возвращаем свежую копию из кэша
+                    _etag_cache[etag_key] = _etag_cache.pop(etag_key)
+                    return cached[1] if text else orjson.loads(cached[1])
+                elif response.status == 404:
                     return ""
-                async with session.get(url, headers=self.headers) as response:
-                    if response.status == 404:
-                        return ""
-                    elif response.status == 200:
-                        return await response.text() if text else await response.json()
-                    else:
-                        error_detail = await response.text()
-                        raise HTTPException(
-                            status_code=response.status,
-                            detail=f"GitHub API error: {error_detail}",
+                elif response.status == 200:
+                    # orjson парсит заметно быстрее стандартного json,
+                    # который использует response.json()
+                    result = (
+                        await response.text()
+                        if text
+                        else orjson.loads(await response.read())
+                    )
+                    etag = response.headers.get("ETag")
+                    if etag:
+                        _etag_cache.pop(etag_key, None)
+                        _etag_cache[etag_key] = (
+                            etag,
+                            result if text else orjson.dumps(result),
                         )
+                        while len(_etag_cache) > MAX_ETAG_ENTRIES:
+                            del _etag_cache[next(iter(_etag_cache))]
+                    return result
+                else:
+                    error_detail = await response.text()
+                    raise HTTPException(
+                        status_code=response.status,
+                        detail=f"GitHub API error: {error_detail}",
+                    )
+
+        if type(urls) is list:
+            # Дедупликация с сохранением порядка: каждый URL запрашивается
+            # один раз; пустые URL не планируются задачами вовсе
+            unique_urls = [url for url in dict.fromkeys(urls) if url]
+            try:
+                async with asyncio.TaskGroup() as tg:
+                    tasks = {url: tg.create_task(fetch(url)) for url in unique_urls}
+            except ExceptionGroup as eg:
+                raise eg.exceptions[0] from None
+            return [tasks[url].result() if url else "" for url in urls]
+        else:
+            return await fetch(urls)
+
+    async def graphql_query(self, query: str, variables: dict = None) -> dict:
+        """Выполняет запрос к GitHub GraphQL API.
 
-            if type(urls) is list:
-                return await asyncio.gather(*[fetch(url) for url in urls])
-            else:
-                return await fetch(urls)
+        Позволяет забирать PR, коммиты и файлы одним запросом вместо серии
+        REST-вызовов; GraphQL использует балльный rate limit, поэтому размер
+        страницы в запросах стоит держать небольшим.
+        """
+        async with self._get_session().post(
+            f"{self.GITHUB_API_URL}/graphql",
+            headers=self.headers,
+            json={"query": query, "variables": variables or {}},
+        ) as response:
+            if response.status != 200:
+                error_detail = await response.text()
+                raise HTTPException(
+                    status_code=response.status,
+                    detail=f"GitHub API error: {error_detail}",
+                )
+            payload = orjson.loads(await response.read())
+
+        if payload.get("errors"):
+            raise HTTPException(
+                status_code=502,
+                detail=f"GitHub GraphQL error: {payload['errors']}",
+            )
+        return payload.get("data", {})
 
     async def get_repo_info(self, owner: str, repo: str) -> dict:
         """Получает информацию о репозитории."""
-        result = await self.get_async(f"{self.GITHUB_API_URL}/repos/{owner}/{repo}")
-        return result if result else {}
+        cache_key = ("repo_info", owner, repo, self._cache_token())
+
+        async def fetch():
+            result = await self.get_async(
+                f"{self.GITHUB_API_URL}/repos/{owner}/{repo}"
+            )
+            return result if result else {}
+
+        return await _get_or_fetch(cache_key, REPO_INFO_CACHE_TTL, fetch)
 
     async def get_merged_prs(
         self,
@@ -61,22 +289,34 @@ class GitHubService:
         date_filter: str = "",
     ) -> dict:
         """Получает список объединенных PR от указанного контрибьютора."""
-        urls = []
-        for contributor in contributors_logins:
-            author = f"+author:{contributor}" if contributor else ""
-            query = f"repo:{owner}/{repo}{author}+is:pr+is:merged{date_filter}"
-            urls.append(f"{self.GITHUB_API_URL}/search/issues?q={query}")
+        cache_key = (
+            "merged_prs",
+            owner,
+            repo,
+            tuple(contributors_logins),
+            date_filter,
+            self._cache_token(),
+        )
+        async def fetch():
+            urls = []
+            for contributor in contributors_logins:
+                author = f"+author:{contributor}" if contributor else ""
+                query = f"repo:{owner}/{repo}{author}+is:pr+is:merged{date_filter}"
+                urls.append(
+                    f"{self.GITHUB_API_URL}/search/issues?q={query}&per_page=100"
+                )
 
-        results = await self.get_async(urls)
+            results = await self.get_async(urls)
 
-        if len(contributors_logins) > 1:
-            return [
-                {"login": contributor, "count": result["total_count"]}
-                for result, contributor in zip(results, contributors_logins)
-            ]
-        else:
+            if len(contributors_logins) > 1:
+                return [
+                    {"login": contributor, "count": result["total_count"]}
+                    for result, contributor in zip(results, contributors_logins)
+                ]
             return results[0]
 
+        return await _get_or_fetch(cache_key, MERGED_PRS_CACHE_TTL, fetch)
+
     async def get_prs_commits(
         self, owner: str, repo: str, contributor_login: str, pr_numbers: List[int]
     ) -> Dict[int, List[dict]]:
@@ -112,38 +352,49 @@ class GitHubService:
         if not repo:
             return []
 
-        url_contributors = f"{self.GITHUB_API_URL}/repos/{owner}/{repo}/contributors"
+        cache_key = ("contributors", owner, repo, self._cache_token())
 
-        contributors = await self.get_async(url_contributors)
-        contributors = await self.get_async(
-            [
-                f"{self.GITHUB_API_URL}/users/{contributor['login']}"
-                for contributor in contributors
-            ]
-        )
+        async def fetch():
+            url_contributors = (
+                f"{self.GITHUB_API_URL}/repos/{owner}/{repo}/contributors"
+            )
 
-        contributors_email = {}
-        for contributor in contributors:
-            commits = await self.get_async(
-                [
-                    f"https://api.github.com/repos/{owner}/{repo}/commits?author={contributor['login']}"
-                ]
+            base_contributors = await self.get_async(url_contributors)
+            logins = [contributor["login"] for contributor in base_contributors]
+
+            # Профили и коммиты зависят только от списка логинов — обе пачки
+            # запрашиваются параллельно вместо двух последовательных волн
+            contributors, commits_lists = await asyncio.gather(
+                self.get_async(
+                    [f"{self.GITHUB_API_URL}/users/{login}" for login in logins]
+                ),
+                self.get_async(
+                    [
+                        f"https://api.github.com/repos/{owner}/{repo}/commits?author={login}"
+                        for login in logins
+                    ]
+                ),
             )
-            if commits and commits[0]:
-                contributors_email[commits[0][-1]["author"]["login"]] = commits[0][-1][
-                    "commit"
-                ]["author"]["email"]
-
-        contributors = [
-            {
-                **contributor,
-                "login": contributor["login"],
-                "email": contributors_email[contributor_login],
-            }
-            for contributor, contributor_login in zip(contributors, contributors_email)
-        ]
 
-        return contributors
+            contributors_email = {}
+            for commits in commits_lists:
+                if commits:
+                    contributors_email[commits[-1]["author"]["login"]] = commits[
+                        -1
+                    ]["commit"]["author"]["email"]
+
+            return [
+                {
+                    **contributor,
+                    "login": contributor["login"],
+                    "email": contributors_email[contributor_login],
+                }
+                for contributor, contributor_login in zip(
+                    contributors, contributors_email
+                )
+            ]
+
+        return await _get_or_fetch(cache_key, CONTRIBUTORS_CACHE_TTL, fetch)
 
     async def get_commits_details(self, commit_urls: List[str]) -> List[dict]:
         """Получает детальную информацию о нескольких коммитах."""
@@ -155,28 +406,35 @@ class GitHubService:
     async def get_row_files(
         self, merged_prs: dict, pr_commits: dict, commit_details: dict
     ) -> List[dict]:
-        """Получает код файлов в виде текста."""
+        """Получает код файлов в виде текста.
+
+        Все raw-файлы независимы, поэтому URL собираются в один плоский
+        список и запрашиваются одним fan-out (параллелизм ограничивает
+        семафор внутри get_async), а не группами по коммитам.
+        """
         result = {}
+        positions = []
+        urls = []
 
         for pr_index, item in enumerate(merged_prs["items"]):
-            pr_number = item["number"]
-            commits_for_pr = pr_commits.get(pr_number, [])
-
-            if not result.get(pr_index):
-                result[pr_index] = {}
+            commits_for_pr = pr_commits.get(item["number"], [])
+            pr_slot = result.setdefault(pr_index, {})
 
             for commit_index, commit_info in enumerate(commits_for_pr):
                 commit_detail = commit_details.get(commit_info["url"], {})
+                files = commit_detail.get("files", [])
+                pr_slot[commit_index] = [""] * len(files)
 
-                if not result.get(pr_index).get(commit_index):
-                    result[pr_index][commit_index] = []
+                for file_index, file in enumerate(files):
+                    if _should_fetch_raw(file):
+                        positions.append((pr_index, commit_index, file_index))
+                        urls.append(file["raw_url"])
 
-                result[pr_index][commit_index] = await self.get_async(
-                    [
-                        file["raw_url"] if ".json" not in file["filename"] else ""
-                        for file in commit_detail.get("files", [])
-                    ],
-                    text=True,
-                )
+        if urls:
+            contents = await self.get_async(urls, text=True)
+            for (pr_index, commit_index, file_index), content in zip(
+                positions, contents
+            ):
+                result[pr_index][commit_index][file_index] = content
 
         return result
@@ -1,11 +1,46 @@
+import asyncio
+import logging
+import sys
+from datetime import datetime
+from functools import lru_cache
 from typing import Dict
 
 import schemas
-from utils.file_utils import create_report_file
+from utils.file_utils import create_report_file, report_files
+from utils.task_state import _normalize_filters, report_tasks_lock
 
 from services.github_service import GitHubService
 from services.email_service import send_email_report
 
+logger = logging.getLogger(__name__)
+
+
+# Соответствие языка репозитория расширениям анализируемых файлов;
+# str.endswith принимает кортеж, так что язык может давать несколько
+# расширений без изменения горячего цикла
+_LANG_EXTENSIONS = {"Python": (".py",), "Java": (".java",)}
+
+
+@lru_cache(maxsize=4096)
+def _parse_commit_date(date_str: str) -> datetime:
+    """Парсит ISO-дату коммита, кэшируя повторы.
+
+    Коммиты одного автора за один день приходят с одинаковыми строками
+    даты — кэш избавляет от повторного парсинга.
+    """
+    return datetime.fromisoformat(date_str)
+
+
+# Ограничение одновременных генераций отчетов: защищает rate limit GitHub
+# и память процесса при всплеске фоновых задач
+REPORT_SEMAPHORE = asyncio.Semaphore(10)
+
+# Одинаковые одновременные сборки отчетов объединяются (single-flight):
+# первый запрос выполняет работу, остальные ждут его Future
+_inflight: Dict[tuple, asyncio.Future] = {}
+_inflight_lock = asyncio.Lock()
+_coalesced_count = 0
+
 
 async def generate_github_report(
     task_id: str,
@@ -18,239 +53,353 @@ async def generate_github_report(
     github_service: GitHubService,
     report_tasks: Dict[str, Dict],
 ):
-    # Импортируем блокировку для безопасного доступа к словарю report_tasks
-    from api.routes import report_tasks_lock
-
     """Background task to generate GitHub report for a specific contributor"""
-    try:
-        # Original get_github_repo code
-        # Формирование фильтра по датам
-        if date_filter != "":
-            date_filter = f"+created:{date_filter}"
-
-        # Update task status to indicate which contributor is being processed
-        with report_tasks_lock:
-            if task_id in report_tasks:
-                print(contributor_login_filter)
-                report_tasks[task_id]["processing_contributor"] = (
-                    contributor_login_filter
-                )
-
-        contributor_details = await github_service.get_repo_contributors(owner, repo)
-
-        # Получение информации о репозитории
-        repo_info = await github_service.get_repo_info(owner, repo)
+    async with REPORT_SEMAPHORE:
+        await _generate_github_report(
+            task_id,
+            owner,
+            repo,
+            contributor_login_filter,
+            contributor_email_filter,
+            date_filter,
+            user_email,
+            github_service,
+            report_tasks,
+        )
 
-        # Построение запроса
-        contributor_login = contributor_login_filter
-        contributor_details = {c["login"]: c for c in contributor_details}
 
-        # Get merged PRs by the contributor
-        merged_prs = await github_service.get_merged_prs(
-            owner, repo, [contributor_login], date_filter
+async def _build_contributor_report(
+    owner: str,
+    repo: str,
+    contributor_login_filter: str,
+    contributor_email_filter: str,
+    date_filter: str,
+    github_service: GitHubService,
+):
+    """Собирает данные GitHub, модель результата и файл отчета для контрибьютора.
+
+    Возвращает кортеж (result, contributor_name, filename); для контрибьютора
+    без смердженных PR filename равен None.
+    """
+    # Построение запроса
+    contributor_login = contributor_login_filter
+
+    # Контрибьютеры, информация о репозитории и поиск PR не зависят друг от
+    # друга — запрашиваем параллельно
+    contributor_details, repo_info, merged_prs = await asyncio.gather(
+        github_service.get_repo_contributors(owner, repo),
+        github_service.get_repo_info(owner, repo),
+        github_service.get_merged_prs(owner, repo, [contributor_login], date_filter),
+        return_exceptions=True,
+    )
+    if isinstance(contributor_details, BaseException):
+        raise contributor_details
+    if isinstance(merged_prs, BaseException):
+        raise merged_prs
+    if isinstance(repo_info, BaseException):
+        # Отчет можно собрать и без метаданных репозитория
+        repo_info = {}
+
+    contributor_details = {c["login"]: c for c in contributor_details}
+
+    if merged_prs["total_count"] == 0:
+        # No merged PRs by this contributor
+        result = schemas.GitHubRepo(
+            total_count=0,
+            items=[],
+            contributor_name=contributor_details.get(contributor_login, {}).get(
+                "name", ""
+            ),
+            contributor_email=contributor_details.get(contributor_login, {}).get(
+                "email", ""
+            ),
+            language=repo_info.get("language", ""),
+            topics=repo_info.get("topics", []),
         )
-
-        if merged_prs["total_count"] == 0:
-            # No merged PRs by this contributor
-            result = schemas.GitHubRepo(
-                total_count=0,
-                items=[],
-                contributor_name=contributor_details.get(contributor_login, {}).get(
-                    "name", ""
-                ),
-                contributor_email=contributor_details.get(contributor_login, {}).get(
-                    "email", ""
-                ),
-                language=repo_info.get("language", ""),
-                topics=repo_info.get("topics", []),
+        return result, result.contributor_name, None
+
+    # Get commits for each PR
+    pr_items = merged_prs.get("items", [])
+    if pr_items:
+        pr_numbers = [item["number"] for item in pr_items]
+        pr_commits = await github_service.get_prs_commits(
+            owner, repo, contributor_login, pr_numbers
+        )
+    else:
+        # No PRs found, create empty dict
+        pr_commits = {}
+
+    async def _fetch_pr_details(commits_for_pr):
+        """Запрашивает детали коммитов одного PR."""
+        commit_urls = [commit["url"] for commit in commits_for_pr if "url" in commit]
+        if not commit_urls:
+            return {}
+        try:
+            details = await github_service.get_commits_details(commit_urls)
+            if details:  # Make sure details are returned
+                return dict(zip(commit_urls, details))
+        except Exception as e:
+            logger.error("Error getting commit details: %s", str(e))
+        return {}
+
+    # Расширения файлов определяются языком репозитория — вычисляем один
+    # раз; кортеж с пустым суффиксом означает «без фильтрации»
+    files_extensions = _LANG_EXTENSIONS.get(repo_info.get("language"), ("",))
+
+    # model_construct пропускает повторную валидацию уже типизированных
+    # данных GitHub API — заметно быстрее на PR с большим числом файлов
+    construct_commit = schemas.Commit.model_construct
+
+    # Обогащаем PR по одному: детали коммитов запрашиваются для текущего PR
+    # и освобождаются сразу после построения моделей, чтобы не держать в
+    # памяти сырой JSON всех коммитов репозитория одновременно. Детали
+    # следующего PR префетчатся фоновой задачей, так что сеть перекрывается
+    # с построением моделей текущего PR
+    detail_task = (
+        asyncio.create_task(
+            _fetch_pr_details(pr_commits.get(pr_items[0]["number"], []))
+        )
+        if pr_items
+        else None
+    )
+    for pr_index, item in enumerate(pr_items):
+        # Enrich the PR with user info
+        if "user" in item and "login" in item["user"]:
+            contributor_login = str(item["user"]["login"])
+            contributor_info = contributor_details.get(contributor_login, {})
+            item["user"] = schemas.User(
+                **item["user"],
+                name=contributor_info.get("name"),
+                email=contributor_info.get("email"),
             )
-            with report_tasks_lock:
-                report_tasks[task_id]["result"] = result.dict()
-                report_tasks[task_id]["status"] = "completed"
 
-            if user_email != "":
-                await send_email_report(
-                    user_email,
-                    {
-                        "repo_owner": owner,
-                        "repo_name": repo,
-                        "contributor_name": result.contributor_name
-                        or "all contributors",
-                        "date_range": date_filter.replace("+created:", "")
-                        if date_filter
-                        else "All time",
-                    },
-                    task_id,
-                    report_tasks,
-                )
+        pr_number = item["number"]
+        # pop освобождает сырые данные коммитов обработанного PR
+        commits_for_pr = pr_commits.pop(pr_number, [])
 
-            return
-
-        # Get commits for each PR
-        if "items" in merged_prs and merged_prs["items"]:
-            pr_numbers = [item["number"] for item in merged_prs["items"]]
-            pr_commits = await github_service.get_prs_commits(
-                owner, repo, contributor_login, pr_numbers
-            )
-        else:
-            # No PRs found, create empty dict
-            pr_commits = {}
-
-        # Get commit details
-        commit_urls = []
-        for commits in pr_commits.values():
-            if commits:  # Make sure commits exist
-                commit_urls.extend(
-                    [commit["url"] for commit in commits if "url" in commit]
+        commit_details = await detail_task
+        if pr_index + 1 < len(pr_items):
+            detail_task = asyncio.create_task(
+                _fetch_pr_details(
+                    pr_commits.get(pr_items[pr_index + 1]["number"], [])
                 )
-
-        commit_details = {}
-        if commit_urls:
-            try:
-                details = await github_service.get_commits_details(commit_urls)
-                if details:  # Make sure details are returned
-                    commit_details = dict(zip(commit_urls, details))
-            except Exception as e:
-                print(f"Error getting commit details: {str(e)}")
-
-        # Enrich the PRs with user info
-        if "items" in merged_prs:
-            for item in merged_prs["items"]:
-                if "user" in item and "login" in item["user"]:
-                    contributor_login = str(item["user"]["login"])
-                    contributor_info = contributor_details.get(contributor_login, {})
-                    item["user"] = schemas.User(
-                        **item["user"],
-                        name=contributor_info.get("name"),
-                        email=contributor_info.get("email"),
-                    )
+            )
 
         # Не убирать!
         # raw_files = await github_service.get_row_files(
         #     merged_prs, pr_commits, commit_details
         # )
 
-        # Обогащаем данные о коммитах
-        for pr_index, item in enumerate(merged_prs["items"]):
-            pr_number = item["number"]
-            commits_for_pr = pr_commits.get(pr_number, [])
-
-            commits = []
-            for commit_index, commit_info in enumerate(commits_for_pr):
-                # Получение детальной информации о коммите
-                commit_detail = commit_details.get(commit_info["url"], {})
-
-                # Обработка файлов в коммите
-                file_list = []
-                for file_index, file in enumerate(commit_detail.get("files", [])):
-                    files_extension = ""
-
-                    if repo_info.get("language") == "Python":
-                        files_extension = ".py"
-                    elif repo_info.get("language") == "Java":
-                        files_extension = ".java"
-
-                    if files_extension in file.get("filename", ""):
-                        file_list.append(
-                            schemas.File(
-                                filename=file["filename"],
-                                additions=file["additions"],
-                                deletions=file["deletions"],
-                                changes=file["changes"],
-                                status=file["status"],
-                                patch=file.get("patch", ""),
-                                # Не убирать!
-                                # raw=raw_files[pr_index][commit_index][file_index],
-                                raw=file["raw_url"],
-                            )
-                        )
-
-                # Создание объекта коммита
-                commits.append(
-                    schemas.Commit(
-                        sha=commit_info["sha"],
-                        url=commit_info["url"],
-                        author=schemas.CommitAuthor(**commit_info["commit"]["author"]),
-                        message=commit_info["commit"]["message"],
-                        files=file_list,
+        # Создание объектов коммитов одним выражением: File — TypedDict,
+        # поэтому достаточно обычных словарей без вызова конструктора модели;
+        # model_construct не приводит типы, и дату коммита парсим явно
+        commit_details_get = commit_details.get
+        item["commits"] = [
+            construct_commit(
+                sha=commit_info["sha"],
+                url=commit_info["url"],
+                author={
+                    "name": sys.intern(commit_info["commit"]["author"]["name"]),
+                    "email": sys.intern(commit_info["commit"]["author"]["email"]),
+                    "date": _parse_commit_date(
+                        commit_info["commit"]["author"]["date"]
+                    ),
+                },
+                message=commit_info["commit"]["message"],
+                files=[
+                    {
+                        "filename": sys.intern(file["filename"]),
+                        "additions": file["additions"],
+                        "deletions": file["deletions"],
+                        "changes": file["changes"],
+                        "status": file["status"],
+                        "patch": file.get("patch", ""),
+                        # Не убирать!
+                        # "raw": raw_files[pr_index][commit_index][file_index],
+                        "raw": file["raw_url"],
+                    }
+                    for file in commit_details_get(commit_info["url"], {}).get(
+                        "files", ()
                     )
-                )
+                    if file.get("filename", "").endswith(files_extensions)
+                ],
+            )
+            for commit_info in commits_for_pr
+        ]
+
+    # Получение топиков репозитория
+    topics = repo_info.get("topics", [])
+    if not topics and "source" in repo_info:
+        topics = repo_info["source"].get("topics", [])
+
+    # Один поиск контрибьютора вместо цепочек .get(login, {}).get(...)
+    contributor = contributor_details.get(contributor_login_filter) or {}
+    has_contributor_filter = bool(
+        contributor_login_filter or contributor_email_filter
+    )
+
+    contributor_id = contributor.get("id") or None
+    contributor_name = contributor.get("name") or (
+        contributor.get("login") if has_contributor_filter else None
+    )
+    contributor_email = (
+        contributor.get("email") if has_contributor_filter else None
+    )
+
+    # Формирование результата для текущего контрибьютера через
+    # предкомпилированный адаптер схемы
+    result = schemas.GITHUB_REPO_ADAPTER.validate_python(
+        dict(
+            merged_prs,
+            language=repo_info.get("language"),
+            topics=topics,
+            contributor_id=contributor_id,
+            contributor_name=contributor_name,
+            contributor_email=contributor_email,
+            contributor_login=contributor_login_filter,  # Add login to help identify this report
+        )
+    )
 
-            item["commits"] = commits
+    # Generate the report file
+    filename = None
+    try:
+        # Диапазон дат разбирается один раз, а не по split на каждую границу
+        date_filter_cleaned = (
+            date_filter.replace("+created:", "") if date_filter else ""
+        )
+        if ".." in date_filter_cleaned:
+            start_date, _, end_date = date_filter_cleaned.partition("..")
+        else:
+            start_date = end_date = None
+
+        file_path, filename = await create_report_file(
+            owner,
+            repo,
+            result,
+            contributor_details,
+            contributor_login_filter,
+            start_date=start_date,
+            end_date=end_date,
+        )
 
-        # Получение топиков репозитория
-        topics = repo_info.get("topics", [])
-        if not topics and "source" in repo_info:
-            topics = repo_info["source"].get("topics", [])
+        # Store the report file path in the global dictionary
+        files_key = f"{owner}/{repo}/{contributor_login_filter}"
+        report_files[files_key] = str(file_path)
 
-        contributor_id = (
-            contributor_details.get(contributor_login_filter, {}).get("id")
-            if contributor_details.get(contributor_login_filter, {}).get("id")
-            else None
+        # Add the report file path to the result without re-validating
+        # the whole object graph
+        result = result.model_copy(
+            update={"report_file": str(file_path), "report_filename": filename}
         )
+    except Exception as e:
+        logger.error("Error generating report file: %s", str(e))
+
+    return result, contributor_name, filename
 
-        contributor_name = (
-            contributor_details.get(contributor_login_filter, {}).get("name")
-            if contributor_details.get(contributor_login_filter, {}).get("name")
-            else contributor_details.get(contributor_login_filter, {}).get("login")
-            if contributor_login_filter or contributor_email_filter
-            else None
-        )
 
-        contributor_email = (
-            contributor_details.get(contributor_login_filter, {}).get("email")
-            if contributor_login_filter or contributor_email_filter
-            else None
+async def _generate_github_report(
+    task_id: str,
+    owner: str,
+    repo: str,
+    contributor_login_filter: str,
+    contributor_email_filter: str,
+    date_filter: str,
+    user_email: str,
+    github_service: GitHubService,
+    report_tasks: Dict[str, Dict],
+):
+    global _coalesced_count
+
+    try:
+        # Original get_github_repo code
+        # Формирование фильтра по датам (логин не приводим к нижнему регистру:
+        # contributor_details здесь индексируется по оригинальному логину)
+        date_filter = _normalize_filters("", "", date_filter)[2]
+
+        # Читаемый диапазон дат для писем вычисляется один раз
+        date_range = (
+            date_filter.replace("+created:", "") if date_filter else "All time"
         )
 
-        # Формирование результата для текущего контрибьютера
-        result = schemas.GitHubRepo(
-            **merged_prs,
-            language=repo_info.get("language"),
-            topics=topics,
-            contributor_id=contributor_id,
-            contributor_name=contributor_name,
-            contributor_email=contributor_email,
-            contributor_login=contributor_login_filter,  # Add login to help identify this report
+        # Update task status to indicate which contributor is being processed
+        async with report_tasks_lock:
+            if task_id in report_tasks:
+                logger.debug("Processing contributor %s", contributor_login_filter)
+                report_tasks[task_id]["processing_contributor"] = (
+                    contributor_login_filter
+                )
+
+        # Одинаковые одновременные запросы выполняют сборку один раз.
+        # Дайджест токена в ключе не дает склеивать сборки разных
+        # пользователей: данные приватного репозитория, полученные с чужими
+        # правами, не должны доставаться присоединившемуся запросу
+        key = (
+            owner,
+            repo,
+            contributor_login_filter,
+            contributor_email_filter,
+            date_filter,
+            github_service._cache_token(),
         )
+        async with _inflight_lock:
+            build_future = _inflight.get(key)
+            is_leader = build_future is None
+            if is_leader:
+                build_future = asyncio.get_running_loop().create_future()
+                _inflight[key] = build_future
+
+        if is_leader:
+            try:
+                build = await _build_contributor_report(
+                    owner,
+                    repo,
+                    contributor_login_filter,
+                    contributor_email_filter,
+                    date_filter,
+                    github_service,
+                )
+                build_future.set_result(build)
+            except Exception as build_error:
+                build_future.set_exception(build_error)
+                build_future.exception()  # помечаем как обработанное
+                raise
+            finally:
+                async with _inflight_lock:
+                    _inflight.pop(key, None)
+        else:
+            _coalesced_count += 1
+            logger.info("Coalesced report build #%d for %s", _coalesced_count, key)
+            build = await build_future
 
-        # Generate the report file
-        try:
-            date_filter_cleaned = (
-                date_filter.replace("+created:", "") if date_filter else ""
-            )
-            file_path, filename = await create_report_file(
-                owner,
-                repo,
-                result,
-                contributor_details,
-                contributor_login_filter,
-                start_date=date_filter_cleaned.split("..")[0]
-                if ".." in date_filter_cleaned
-                else None,
-                end_date=date_filter_cleaned.split("..")[1]
-                if ".." in date_filter_cleaned
-                else None,
-            )
+        result, contributor_name, filename = build
 
-            # Store the report file path in the global dictionary
-            from utils.file_utils import report_files
+        # Сериализуем результат один раз и вне блокировки: полный обход
+        # большого дерева PR/коммитов не должен удерживать report_tasks_lock
+        result_dict = result.model_dump()
 
-            key = f"{owner}/{repo}/{contributor_login_filter}"
-            report_files[key] = str(file_path)
+        if result.total_count == 0:
+            # No merged PRs by this contributor
+            async with report_tasks_lock:
+                report_tasks[task_id]["result"] = result_dict
+                report_tasks[task_id]["status"] = "completed"
 
-            # Add the report file path to the result
-            result_dict = result.dict()
-            result_dict["report_file"] = str(file_path)
-            result_dict["report_filename"] = filename
+            if user_email != "":
+                await send_email_report(
+                    user_email,
+                    {
+                        "repo_owner": owner,
+                        "repo_name": repo,
+                        "contributor_name": contributor_name or "all contributors",
+                        "date_range": date_range,
+                    },
+                    task_id,
+                    report_tasks,
+                )
 
-            # Use the updated result dictionary
-            result = schemas.GitHubRepo(**result_dict)
-        except Exception as e:
-            print(f"Error generating report file: {str(e)}")
+            return
 
         # Store the result in the task's results dictionary
-        with report_tasks_lock:
+        async with report_tasks_lock:
             if task_id in report_tasks:
                 # Update task status for multiple contributors
                 if (
@@ -264,32 +413,37 @@ async def generate_github_report(
                     )
                     # Add to completed list
                     if "completed_contributors" in report_tasks[task_id]:
-                        report_tasks[task_id]["completed_contributors"].append(
+                        report_tasks[task_id]["completed_contributors"].add(
                             contributor_login_filter
                         )
 
                     # Store this contributor's report in the results dictionary
                     if "results" in report_tasks[task_id]:
                         report_tasks[task_id]["results"][contributor_login_filter] = (
-                            result.dict()
+                            result_dict
                         )
 
                     # Update overall status
                     if len(report_tasks[task_id]["pending_contributors"]) == 0:
                         # All contributors processed
                         report_tasks[task_id]["status"] = "completed"
-                        print(f"All reports for task {task_id} generated successfully")
+                        logger.info(
+                            "All reports for task %s generated successfully", task_id
+                        )
                     else:
                         # More contributors to process
                         report_tasks[task_id]["status"] = "partial"
-                        print(
-                            f"Report for {contributor_name} ({contributor_login_filter}) generated successfully. {len(report_tasks[task_id]['pending_contributors'])} contributors remaining."
+                        logger.info(
+                            "Report for %s (%s) generated successfully. %d contributors remaining.",
+                            contributor_name,
+                            contributor_login_filter,
+                            len(report_tasks[task_id]["pending_contributors"]),
                         )
                 else:
                     # Single contributor workflow or fallback
-                    report_tasks[task_id]["result"] = result.dict()
+                    report_tasks[task_id]["result"] = result_dict
                     report_tasks[task_id]["status"] = "completed"
-                    print("Report generated successfully")
+                    logger.info("Report generated successfully")
 
         if user_email != "":
             # Send email with report
@@ -301,9 +455,7 @@ async def generate_github_report(
                     "contributor_name": contributor_name or "all contributors",
                     "contributor_login": contributor_login_filter,  # Add login to identify this report
                     "filename": filename,
-                    "date_range": date_filter.replace("+created:", "")
-                    if date_filter
-                    else "All time",
+                    "date_range": date_range,
                 },
                 task_id,
                 report_tasks,
@@ -314,7 +466,7 @@ async def generate_github_report(
 
     except Exception as e:
         # Mark this specific contributor as failed
-        with report_tasks_lock:
+        async with report_tasks_lock:
             if (
                 task_id in report_tasks
                 and "pending_contributors" in report_tasks[task_id]
@@ -325,8 +477,8 @@ async def generate_github_report(
                     contributor_login_filter
                 )
                 if "failed_contributors" not in report_tasks[task_id]:
-                    report_tasks[task_id]["failed_contributors"] = []
-                report_tasks[task_id]["failed_contributors"].append(
+                    report_tasks[task_id]["failed_contributors"] = set()
+                report_tasks[task_id]["failed_contributors"].add(
                     contributor_login_filter
                 )
 
@@ -343,4 +495,6 @@ async def generate_github_report(
                 report_tasks[task_id]["status"] = "failed"
 
             report_tasks[task_id]["error"] = str(e)
-            print(f"Error generating report for {contributor_login_filter}: {str(e)}")
+            logger.error(
+                "Error generating report for %s: %s", contributor_login_filter, str(e)
+            )
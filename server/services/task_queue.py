@@ -0,0 +1,64 @@
+import asyncio
+import contextvars
+import logging
+from itertools import count
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты задач: меньший номер обрабатывается раньше.
+# Интерактивные запросы (high) не ждут окончания массовых (low)
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+DEFAULT_PRIORITY = "normal"
+
+_queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+# Монотонный счётчик сохраняет FIFO-порядок внутри одного приоритета
+_counter = count()
+_workers: List[asyncio.Task] = []
+
+
+async def enqueue(coro_factory: Callable, priority: str = DEFAULT_PRIORITY) -> int:
+    """Ставит задачу в очередь и возвращает её позицию на момент постановки."""
+    await _queue.put(
+        (
+            PRIORITIES.get(priority, PRIORITIES[DEFAULT_PRIORITY]),
+            next(_counter),
+            coro_factory,
+            # Контекст запроса (в т.ч. токен авторизации GitHub) переносится
+            # в воркер вместе с задачей
+            contextvars.copy_context(),
+        )
+    )
+    return _queue.qsize()
+
+
+async def _worker():
+    while True:
+        _, _, coro_factory, context = await _queue.get()
+        try:
+            await asyncio.create_task(coro_factory(), context=context)
+        except Exception as e:
+            logger.error("Queued report task failed: %s", str(e))
+        finally:
+            _queue.task_done()
+
+
+# Несколько воркеров обрабатывают независимые отчеты параллельно:
+# время N-контрибьюторной задачи стремится к max(T_i) вместо суммы.
+# Давление на GitHub API ограничивают REPORT_SEMAPHORE и семафор в get_async
+DEFAULT_WORKERS = 4
+
+
+def start_workers(count: int = DEFAULT_WORKERS):
+    """Запускает фоновых воркеров очереди (вызывается при старте приложения)."""
+    loop = asyncio.get_running_loop()
+    for _ in range(count):
+        _workers.append(loop.create_task(_worker()))
+
+
+async def stop_workers():
+    """Останавливает воркеров очереди (вызывается при остановке приложения)."""
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
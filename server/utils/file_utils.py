@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime
 from pathlib import Path
 
@@ -13,13 +14,14 @@ REPORTS_DIR.mkdir(exist_ok=True)
 report_files = {}
 
 
+# Windows doesn't allow these characters in filenames: \ / : * ? " < > |
+# Таблица замен строится один раз при импорте модуля
+_INVALID_CHARS_TRANS = str.maketrans({char: "_" for char in '\\/:*?"<>|'})
+
+
 # Function to sanitize filename to be compatible with Windows file system
 def sanitize_filename(filename):
-    # Windows doesn't allow these characters in filenames: \ / : * ? " < > |
-    invalid_chars = ["\\", "/", ":", "*", "?", '"', "<", ">", "|"]
-    for char in invalid_chars:
-        filename = filename.replace(char, "_")
-    return filename
+    return filename.translate(_INVALID_CHARS_TRANS)
 
 
 # Function to sanitize date string for filename
@@ -30,6 +32,18 @@ def sanitize_date_for_filename(date_str):
     return sanitize_filename(date_str)
 
 
+def _diff_fragments(result: schemas.GitHubRepo):
+    """Отдает фрагменты дифа по одному файлу за раз."""
+    for merge in result.items:
+        for commit in merge.commits:
+            for file in commit.files:
+                commit_filename = str(file["filename"]).rsplit("/", 1)[-1]
+                yield (
+                    f"### {commit_filename}\n\n"
+                    f"# user code in {commit_filename}\n{file['patch']}\n\n"
+                )
+
+
 # Function to generate a report file and return its path
 async def create_report_file(
     owner: str,
@@ -42,7 +56,7 @@ async def create_report_file(
 ):
     # Create folder structure for reports if it doesn't exist
     repo_dir = REPORTS_DIR / owner / repo
-    repo_dir.mkdir(parents=True, exist_ok=True)
+    await asyncio.to_thread(repo_dir.mkdir, parents=True, exist_ok=True)
 
     # Sanitize dates for filename
     safe_start_date = sanitize_date_for_filename(start_date)
@@ -62,20 +76,9 @@ async def create_report_file(
     filename = f"{contributor_login}{date_part}_{timestamp}.md"
     file_path = repo_dir / filename
 
-    diff_input = ""
-
-    merges = result.items
-
-    for merge in merges:
-        commits = merge.commits
-        for commit in commits:
-            files = commit.files
-            for file in files:
-                commit_filename_split = str(file.filename).split("/")
-                commit_filename = commit_filename_split[-1]
-                commit_patch = file.patch
-
-                diff_input += f"### {commit_filename}\n\n# user code in {commit_filename}\n{commit_patch}\n\n"
+    # Диф собирается одним join по генератору: без квадратичной
+    # конкатенации строк и без удержания промежуточных копий в памяти
+    diff_input = "".join(_diff_fragments(result))
 
     analyzer = CodeAnalysisCrew(
         diff_input=diff_input,
@@ -83,7 +86,9 @@ async def create_report_file(
         file_name=filename,
         contributor=contributor_details[contributor_login],
     )
-    analyzer.analyze()
+    # Анализ выполняет блокирующие запросы к LLM и пишет отчет на диск —
+    # уводим его в поток, чтобы не останавливать event loop
+    await asyncio.to_thread(analyzer.analyze)
 
     # Generate a simple PDF report (in a real app, you'd use a PDF library)
     # For now, we'll create a dummy PDF file
@@ -97,7 +102,18 @@ async def create_report_file(
     return file_path, filename
 
 
+# Абсолютный корень отчетов вычисляется один раз при импорте
+_REPORTS_ABS = REPORTS_DIR.resolve()
+
+
 # Function to get the path to a report file
 def get_report_file_path(owner: str, repo: str, filename: str) -> str:
-    """Get the path to a report file"""
-    return f"./reports/{owner}/{repo}/{filename}"
+    """Get the path to a report file.
+
+    Путь строится от единого корня REPORTS_DIR; компоненты, выводящие
+    за его пределы (../ и т.п.), отклоняются.
+    """
+    path = (_REPORTS_ABS / owner / repo / filename).resolve()
+    if not path.is_relative_to(_REPORTS_ABS):
+        raise ValueError("Report path escapes the reports directory")
+    return str(path)
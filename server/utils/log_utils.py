@@ -0,0 +1,29 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+
+# Записи уходят в очередь и пишутся фоновым потоком (QueueListener),
+# поэтому логирование не блокирует event loop на synchronous stdio
+_log_queue: queue.Queue = queue.Queue(-1)
+_listener: logging.handlers.QueueListener | None = None
+
+
+def setup_logging(level: int = logging.INFO):
+    """Настраивает неблокирующее логирование через QueueHandler/QueueListener."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(_log_queue))
+
+    _listener = logging.handlers.QueueListener(_log_queue, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -0,0 +1,45 @@
+import asyncio
+import time
+from functools import lru_cache
+from typing import Dict
+
+# Dictionary to store the status of background tasks
+# Ключ - task_id, значение - информация о задаче
+report_tasks: Dict[str, Dict] = {}
+# Блокировка для безопасного доступа к словарю report_tasks: asyncio.Lock
+# не блокирует event loop при конкуренции — ожидание становится
+# кооперативной точкой переключения
+report_tasks_lock = asyncio.Lock()
+
+# Время жизни задачи в памяти: по истечении запись удаляется, чтобы словарь
+# report_tasks не рос бесконечно
+TASK_TTL_SECONDS = 3600
+
+
+# Статусы, при которых задача еще выполняется: такие записи не вытесняются,
+# даже если задача простояла в очереди дольше TTL — иначе опрашивающий клиент
+# получит 404, а завершение задачи упадет на записи результата
+_ACTIVE_STATUSES = frozenset({"processing", "partial"})
+
+
+def _purge_expired_tasks():
+    """Удаляет устаревшие завершенные задачи. Вызывать только под report_tasks_lock."""
+    deadline = time.monotonic() - TASK_TTL_SECONDS
+    expired = [
+        task_id
+        for task_id, task_info in report_tasks.items()
+        if task_info.get("created_at", 0) < deadline
+        and task_info.get("status") not in _ACTIVE_STATUSES
+    ]
+    for task_id in expired:
+        del report_tasks[task_id]
+
+
+@lru_cache(maxsize=1024)
+def _normalize_filters(login: str, email: str, date: str) -> tuple:
+    """Нормализует фильтры контрибьютора и дат; пустые значения не трогаем."""
+    return (
+        login.lower() if login else "",
+        email.lower() if email else "",
+        f"+created:{date}" if date else "",
+    )